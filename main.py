@@ -1,15 +1,34 @@
 from fastapi import FastAPI, File, UploadFile, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel
 from typing import List, Optional
-import pytesseract
+from concurrent.futures import ProcessPoolExecutor
+import asyncio
+import hashlib
+import os
+import tempfile
+import threading
+import ahocorasick
+import diskcache
+import fitz
+import numpy as np
+import tesserocr
 from PIL import Image
 import pdf2image
 import io
 import re
 from enum import Enum
 
-app = FastAPI(title="Construction Drawing Classifier API")
+# orjson serializes the per-page result lists ~3x faster than the default
+# json encoder, which matters on multi-hundred-page sets
+app = FastAPI(
+    title="Construction Drawing Classifier API",
+    default_response_class=ORJSONResponse,
+)
+
+# Classification results keyed by PDF content hash, persisted on disk so
+# repeated uploads of the same document skip OCR entirely
+result_cache = diskcache.Cache("/tmp/planparse")
 
 
 class DrawingType(str, Enum):
@@ -38,211 +57,283 @@ class ClassificationResult(BaseModel):
     drawing_number: Optional[str] = None
 
 
+# Keywords for each drawing type
+_KEYWORDS = {
+    DrawingType.COVER: (
+        "cover",
+        "title sheet",
+        "project title",
+        "drawing index",
+        "sheet index",
+        "consultants",
+        "project team",
+    ),
+    DrawingType.PROJECT_INFO: (
+        "general notes",
+        "legend",
+        "abbreviations",
+        "symbols",
+        "project information",
+        "code analysis",
+        "vicinity map",
+    ),
+    DrawingType.SITE_PLAN: (
+        "site plan",
+        "plot plan",
+        "survey",
+        "property line",
+        "setback",
+        "parking layout",
+        "landscape",
+    ),
+    DrawingType.FLOOR_PLAN: (
+        "floor plan",
+        "layout",
+        "room schedule",
+        "door schedule",
+        "window schedule",
+        "partition",
+        "furniture plan",
+    ),
+    DrawingType.ELEVATION: (
+        "elevation",
+        "exterior elevation",
+        "building elevation",
+        "north elevation",
+        "south elevation",
+        "east elevation",
+        "west elevation",
+    ),
+    DrawingType.SECTION: (
+        "section",
+        "building section",
+        "wall section",
+        "detail section",
+        "cross section",
+    ),
+    DrawingType.ROOF_PLAN: (
+        "roof plan",
+        "roof framing",
+        "roof layout",
+        "roofing plan",
+    ),
+    DrawingType.FOUNDATION: (
+        "foundation",
+        "footing",
+        "basement",
+        "slab",
+        "pier",
+        "foundation plan",
+        "grading plan",
+    ),
+    DrawingType.ELECTRICAL: (
+        "electrical",
+        "power plan",
+        "lighting",
+        "panel schedule",
+        "circuit",
+        "receptacle",
+        "switch",
+    ),
+    DrawingType.PLUMBING: (
+        "plumbing",
+        "sanitary",
+        "water",
+        "drainage",
+        "fixture",
+        "domestic water",
+        "waste",
+    ),
+    DrawingType.MECHANICAL: (
+        "mechanical",
+        "hvac",
+        "duct",
+        "ventilation",
+        "air conditioning",
+        "heating",
+        "exhaust",
+    ),
+    DrawingType.STRUCTURAL: (
+        "structural",
+        "framing",
+        "beam",
+        "column",
+        "truss",
+        "steel",
+        "concrete",
+        "reinforcing",
+    ),
+    DrawingType.DETAIL: (
+        "detail",
+        "enlarged",
+        "typical detail",
+        "construction detail",
+    ),
+    DrawingType.SCHEDULE: (
+        "schedule",
+        "finish schedule",
+        "door schedule",
+        "window schedule",
+        "room finish",
+    ),
+}
+
+# Drawing number prefixes (standard AIA convention)
+_DRAWING_PREFIXES = {
+    "A": DrawingType.FLOOR_PLAN,  # Architectural
+    "S": DrawingType.STRUCTURAL,
+    "E": DrawingType.ELECTRICAL,
+    "M": DrawingType.MECHANICAL,
+    "P": DrawingType.PLUMBING,
+    "L": DrawingType.SITE_PLAN,  # Landscape
+    "C": DrawingType.SITE_PLAN,  # Civil
+}
+
+# Integer-coded drawing type order used by the keyword scorer
+_DRAWING_TYPES = tuple(_KEYWORDS)
+
+
+def _build_keyword_automaton() -> ahocorasick.Automaton:
+    """Build the Aho-Corasick automaton over all keywords: one linear pass
+    over the text finds every occurrence of every keyword at once. Some
+    keywords belong to several drawing types (e.g. "door schedule"), so each
+    word maps to the indices of the types it scores for; integer indices
+    keep the per-hit scoring work to a plain array increment."""
+    type_index = {dt: i for i, dt in enumerate(_DRAWING_TYPES)}
+
+    keyword_types = {}
+    for drawing_type, keywords in _KEYWORDS.items():
+        for keyword in keywords:
+            keyword_types.setdefault(keyword, []).append(type_index[drawing_type])
+
+    automaton = ahocorasick.Automaton()
+    for keyword, type_indices in keyword_types.items():
+        automaton.add_word(keyword, (keyword, tuple(type_indices)))
+    automaton.make_automaton()
+    return automaton
+
+
+# Built once at import so pool workers inherit it via fork instead of
+# rebuilding per process
+_KEYWORD_AUTOMATON = _build_keyword_automaton()
+
+# Drawing number patterns (A-101, A101, A-1.1) combined into one regex
+# compiled once; IGNORECASE avoids re-uppercasing the page text per call.
+# Each pattern keeps its own group so matches can be ranked: a dashed sheet
+# number anywhere in the text beats an earlier undashed one (OCR noise like
+# dimension strings often matches the undashed form first).
+_DRAWING_NUMBER_RE = re.compile(
+    r"\b(?:([A-Z]-\d{3})|([A-Z]\d{3})|([A-Z]-\d\.\d))\b", re.IGNORECASE
+)
+
+# Sentinel distinguishing "not extracted yet" from "no drawing number found"
+_UNSET = object()
+
+
 class DrawingClassifier:
     def __init__(self):
-        # Keywords for each drawing type
-        self.keywords = {
-            DrawingType.COVER: [
-                "cover",
-                "title sheet",
-                "project title",
-                "drawing index",
-                "sheet index",
-                "consultants",
-                "project team",
-            ],
-            DrawingType.PROJECT_INFO: [
-                "general notes",
-                "legend",
-                "abbreviations",
-                "symbols",
-                "project information",
-                "code analysis",
-                "vicinity map",
-            ],
-            DrawingType.SITE_PLAN: [
-                "site plan",
-                "plot plan",
-                "survey",
-                "property line",
-                "setback",
-                "parking layout",
-                "landscape",
-            ],
-            DrawingType.FLOOR_PLAN: [
-                "floor plan",
-                "layout",
-                "room schedule",
-                "door schedule",
-                "window schedule",
-                "partition",
-                "furniture plan",
-            ],
-            DrawingType.ELEVATION: [
-                "elevation",
-                "exterior elevation",
-                "building elevation",
-                "north elevation",
-                "south elevation",
-                "east elevation",
-                "west elevation",
-            ],
-            DrawingType.SECTION: [
-                "section",
-                "building section",
-                "wall section",
-                "detail section",
-                "cross section",
-            ],
-            DrawingType.ROOF_PLAN: [
-                "roof plan",
-                "roof framing",
-                "roof layout",
-                "roofing plan",
-            ],
-            DrawingType.FOUNDATION: [
-                "foundation",
-                "footing",
-                "basement",
-                "slab",
-                "pier",
-                "foundation plan",
-                "grading plan",
-            ],
-            DrawingType.ELECTRICAL: [
-                "electrical",
-                "power plan",
-                "lighting",
-                "panel schedule",
-                "circuit",
-                "receptacle",
-                "switch",
-            ],
-            DrawingType.PLUMBING: [
-                "plumbing",
-                "sanitary",
-                "water",
-                "drainage",
-                "fixture",
-                "domestic water",
-                "waste",
-            ],
-            DrawingType.MECHANICAL: [
-                "mechanical",
-                "hvac",
-                "duct",
-                "ventilation",
-                "air conditioning",
-                "heating",
-                "exhaust",
-            ],
-            DrawingType.STRUCTURAL: [
-                "structural",
-                "framing",
-                "beam",
-                "column",
-                "truss",
-                "steel",
-                "concrete",
-                "reinforcing",
-            ],
-            DrawingType.DETAIL: [
-                "detail",
-                "enlarged",
-                "typical detail",
-                "construction detail",
-            ],
-            DrawingType.SCHEDULE: [
-                "schedule",
-                "finish schedule",
-                "door schedule",
-                "window schedule",
-                "room finish",
-            ],
-        }
-
-        # Drawing number prefixes (standard AIA convention)
-        self.drawing_prefixes = {
-            "A": DrawingType.FLOOR_PLAN,  # Architectural
-            "S": DrawingType.STRUCTURAL,
-            "E": DrawingType.ELECTRICAL,
-            "M": DrawingType.MECHANICAL,
-            "P": DrawingType.PLUMBING,
-            "L": DrawingType.SITE_PLAN,  # Landscape
-            "C": DrawingType.SITE_PLAN,  # Civil
-        }
-
-    def extract_text_from_image(self, image: Image.Image) -> str:
-        """Extract text from image using OCR"""
-        try:
-            # Focus on title block area (bottom 20% of page)
-            width, height = image.size
-            title_block = image.crop((0, int(height * 0.8), width, height))
+        # In-process tesseract engine, reused across pages. The engine is
+        # not thread-safe, so calls are serialized with a lock.
+        self.tess = tesserocr.PyTessBaseAPI()
+        self.tess_lock = threading.Lock()
 
-            # Extract text from full page and title block
-            full_text = pytesseract.image_to_string(image).lower()
-            title_text = pytesseract.image_to_string(title_block).lower()
+    def ocr_image(self, image: Image.Image) -> str:
+        """Extract text from an image using OCR"""
+        try:
+            # Grayscale halves tesseract's per-pixel work vs RGB
+            if image.mode != "L":
+                image = image.convert("L")
 
-            # Combine with more weight on title block
-            return full_text + "\n" + title_text * 2
+            with self.tess_lock:
+                self.tess.SetImage(image)
+                return self.tess.GetUTF8Text().lower()
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"OCR failed: {str(e)}")
 
     def extract_drawing_number(self, text: str) -> Optional[str]:
         """Extract drawing number (e.g., A-101, E-201, S-301)"""
-        patterns = [
-            r"[A-Z]-\d{3}",  # A-101
-            r"[A-Z]\d{3}",  # A101
-            r"[A-Z]-\d\.\d",  # A-1.1
-        ]
-
-        for pattern in patterns:
-            match = re.search(pattern, text.upper())
-            if match:
-                return match.group(0)
-        return None
+        # One scan over the text, picking the best-ranked pattern rather
+        # than the first positional match of any pattern
+        best = None
+        best_rank = 4
+        for match in _DRAWING_NUMBER_RE.finditer(text):
+            if match.lastindex < best_rank:
+                best = match.group(0)
+                best_rank = match.lastindex
+                if best_rank == 1:
+                    break
+        return best.upper() if best else None
 
     def classify_by_keywords(self, text: str) -> tuple[DrawingType, float, List[str]]:
         """Classify based on keyword matching"""
-        scores = {}
-        found_keywords = {}
-
-        for drawing_type, keywords in self.keywords.items():
-            score = 0
-            found = []
-            for keyword in keywords:
-                if keyword in text:
-                    score += text.count(keyword)
-                    found.append(keyword)
-            scores[drawing_type] = score
-            found_keywords[drawing_type] = found
-
-        if not any(scores.values()):
+        scores = np.zeros(len(_DRAWING_TYPES), dtype=np.int32)
+        found_keywords = [[] for _ in _DRAWING_TYPES]
+
+        for _end, (keyword, type_indices) in _KEYWORD_AUTOMATON.iter(text):
+            for index in type_indices:
+                scores[index] += 1
+                if keyword not in found_keywords[index]:
+                    found_keywords[index].append(keyword)
+
+        if not scores.any():
             return DrawingType.UNKNOWN, 0.0, []
 
-        best_type = max(scores, key=scores.get)
-        max_score = scores[best_type]
+        best_index = int(scores.argmax())
+        max_score = int(scores[best_index])
         confidence = min(max_score / 5.0, 1.0)  # Normalize to 0-1
 
-        return best_type, confidence, found_keywords[best_type]
+        return _DRAWING_TYPES[best_index], confidence, found_keywords[best_index]
 
     def classify_by_drawing_number(self, drawing_num: str) -> Optional[DrawingType]:
         """Classify based on drawing number prefix"""
         if drawing_num and len(drawing_num) > 0:
             prefix = drawing_num[0].upper()
-            return self.drawing_prefixes.get(prefix)
+            return _DRAWING_PREFIXES.get(prefix)
         return None
 
     def classify_page(self, image: Image.Image, page_num: int) -> ClassificationResult:
-        """Main classification logic"""
-        # Extract text
-        text = self.extract_text_from_image(image)
-
-        # Extract drawing number
+        """Classify a page image via OCR"""
+        # OCR the title block first (bottom 20% of the page, ~5x fewer
+        # pixels); most sheets classify decisively from it alone
+        width, height = image.size
+        title_block = image.crop((0, int(height * 0.8), width, height))
+        text = self.ocr_image(title_block)
+
+        # Only skip full-page OCR when the title block is decisive: either a
+        # dominant keyword score, or a mapped drawing-number prefix at a
+        # keyword confidence low enough (< 0.5) that classify_text really
+        # lets the prefix decide. Unmapped prefixes like G-101 or T-101 and
+        # the mid-confidence band still need the full page.
+        keyword_scores = self.classify_by_keywords(text)
         drawing_num = self.extract_drawing_number(text)
-
-        # Classify by keywords
-        keyword_type, keyword_confidence, keywords = self.classify_by_keywords(text)
+        prefix_decides = (
+            keyword_scores[1] < 0.5
+            and self.classify_by_drawing_number(drawing_num) is not None
+        )
+        if keyword_scores[1] < 0.6 and not prefix_decides:
+            full_text = self.ocr_image(image)
+            text = full_text + "\n" + text * 2
+            keyword_scores = self.classify_by_keywords(text)
+            drawing_num = self.extract_drawing_number(text)
+
+        return self.classify_text(text, page_num, keyword_scores, drawing_num)
+
+    def classify_text(
+        self,
+        text: str,
+        page_num: int,
+        keyword_scores: Optional[tuple] = None,
+        drawing_num: Optional[str] = _UNSET,
+    ) -> ClassificationResult:
+        """Classify a page from already-extracted lowercase text"""
+        # Classify by keywords (reuse scores if the caller already scanned)
+        if keyword_scores is None:
+            keyword_scores = self.classify_by_keywords(text)
+        keyword_type, keyword_confidence, keywords = keyword_scores
+
+        # Extract drawing number (reuse the caller's result if provided)
+        if drawing_num is _UNSET:
+            drawing_num = self.extract_drawing_number(text)
 
         # Classify by drawing number
         prefix_type = (
@@ -276,6 +367,41 @@ class DrawingClassifier:
 
 classifier = DrawingClassifier()
 
+# Per-process classifier for pool workers (built once per worker process)
+_worker_classifier: Optional[DrawingClassifier] = None
+
+
+def _init_worker():
+    """Build the per-process classifier, loading the tesseract model once"""
+    global _worker_classifier
+    _worker_classifier = DrawingClassifier()
+
+
+def _classify_paths(batch: list) -> List[ClassificationResult]:
+    """Classify a batch of rendered (image_path, page_number) pairs in a
+    worker, reusing its long-lived tesseract engine across the batch"""
+    if _worker_classifier is None:
+        _init_worker()
+    results = []
+    for path, page_num in batch:
+        image = Image.open(path)
+        results.append(_worker_classifier.classify_page(image, page_num))
+    return results
+
+
+@app.on_event("startup")
+def start_ocr_pool():
+    """Start the OCR worker pool once so each worker loads the tesseract
+    language model a single time for the life of the server"""
+    app.state.ocr_executor = ProcessPoolExecutor(
+        max_workers=os.cpu_count(), initializer=_init_worker
+    )
+
+
+@app.on_event("shutdown")
+def stop_ocr_pool():
+    app.state.ocr_executor.shutdown()
+
 
 @app.post("/classify/image", response_model=ClassificationResult)
 async def classify_image(file: UploadFile = File(...)):
@@ -299,17 +425,114 @@ async def classify_pdf(file: UploadFile = File(...)):
         raise HTTPException(status_code=400, detail="File must be a PDF")
 
     try:
-        contents = await file.read()
-
-        # Convert PDF to images
-        images = pdf2image.convert_from_bytes(contents, dpi=150)
-
-        # Classify each page
-        results = []
-        for i, image in enumerate(images, start=1):
-            result = classifier.classify_page(image, page_num=i)
-            results.append(result)
-
+        with tempfile.NamedTemporaryFile(suffix=".pdf") as upload:
+            # Stream the upload to disk in chunks, hashing as it arrives,
+            # instead of buffering the whole PDF as a bytes object; PyMuPDF
+            # and poppler then read the file through the OS page cache
+            hasher = hashlib.blake2b(digest_size=16)
+            while chunk := await file.read(1024 * 1024):
+                upload.write(chunk)
+                hasher.update(chunk)
+            upload.flush()
+
+            # Return cached results for previously classified documents
+            pdf_hash = hasher.hexdigest()
+            cached_results = result_cache.get(pdf_hash)
+            if cached_results is not None:
+                return cached_results
+
+            # Many construction PDFs carry an embedded text layer; classify
+            # those pages straight from it and only rasterize + OCR the
+            # image-only pages
+            ocr_pages = []
+            with fitz.open(upload.name) as doc:
+                results: List[Optional[ClassificationResult]] = [None] * doc.page_count
+                for i, page in enumerate(doc, start=1):
+                    page_text = page.get_text() or ""
+                    if len(page_text) > 100:
+                        results[i - 1] = classifier.classify_text(page_text.lower(), i)
+                    else:
+                        ocr_pages.append(i)
+
+            if ocr_pages:
+                # Contiguous runs of image-only pages, so render cost scales
+                # with the pages that actually get OCR'd rather than the
+                # whole span between the first and last of them
+                ocr_runs = []
+                for p in ocr_pages:
+                    if ocr_runs and p == ocr_runs[-1][1] + 1:
+                        ocr_runs[-1][1] = p
+                    else:
+                        ocr_runs.append([p, p])
+
+                with tempfile.TemporaryDirectory() as tmpdir:
+                    # Feed pages through a bounded queue into pool workers.
+                    # The producer renders each run to disk in small chunks
+                    # and queues the paths as every chunk finishes, so OCR of
+                    # earlier chunks overlaps rendering of later ones and the
+                    # queue bound caps how far rendering runs ahead of the
+                    # workers. Keyword-level OCR doesn't need 150 DPI RGB;
+                    # 110 DPI grayscale JPEG is a ~3x smaller working set per
+                    # page, and thread_count parallelizes poppler's rendering.
+                    n_workers = os.cpu_count() or 1
+                    page_queue: asyncio.Queue = asyncio.Queue(maxsize=4)
+                    loop = asyncio.get_running_loop()
+
+                    async def feed_pages():
+                        render_chunk = 16  # pages rasterized per poppler call
+                        batch_size = 4  # pages per worker dispatch
+                        for run_start, run_end in ocr_runs:
+                            for chunk_start in range(
+                                run_start, run_end + 1, render_chunk
+                            ):
+                                chunk_end = min(
+                                    chunk_start + render_chunk - 1, run_end
+                                )
+                                chunk_paths = await asyncio.to_thread(
+                                    pdf2image.convert_from_path,
+                                    upload.name,
+                                    dpi=110,
+                                    grayscale=True,
+                                    fmt="jpeg",
+                                    jpegopt={"quality": 85},
+                                    thread_count=os.cpu_count(),
+                                    output_folder=tmpdir,
+                                    paths_only=True,
+                                    first_page=chunk_start,
+                                    last_page=chunk_end,
+                                )
+                                pairs = [
+                                    (path, chunk_start + offset)
+                                    for offset, path in enumerate(chunk_paths)
+                                ]
+                                for start in range(0, len(pairs), batch_size):
+                                    await page_queue.put(
+                                        pairs[start : start + batch_size]
+                                    )
+                        for _ in range(n_workers):
+                            await page_queue.put(None)
+
+                    async def classify_pages():
+                        while True:
+                            batch = await page_queue.get()
+                            if batch is None:
+                                break
+                            batch_results = await loop.run_in_executor(
+                                app.state.ocr_executor, _classify_paths, batch
+                            )
+                            for result in batch_results:
+                                results[result.page_number - 1] = result
+
+                    # TaskGroup cancels the sibling stages when any one of
+                    # them fails, so consumers aren't left waiting forever
+                    # for sentinels that never arrive and the producer stops
+                    # rendering for a request that has already failed
+                    async with asyncio.TaskGroup() as stages:
+                        stages.create_task(feed_pages())
+                        for _ in range(n_workers):
+                            stages.create_task(classify_pages())
+
+        result_cache.set(pdf_hash, results)
         return results
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"PDF processing failed: {str(e)}")